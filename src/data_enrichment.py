@@ -1,10 +1,236 @@
+import asyncio
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util import Retry
+import threading
 import time
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import json
-from pathlib import Path
+import re
+import os
+import sqlite3
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is optional; fall back to a thread pool
+    aiohttp = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
+# Decode JSON straight from response bytes, skipping text decoding and charset detection
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; fall back to plain NumPy
+    njit = None
+
+# Setup logging once at import time, unless the application already configured it
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+logger = logging.getLogger(__name__)
+
+# ISO 17442 LEI: 18 alphanumeric characters followed by 2 check digits
+LEI_PATTERN = re.compile(r'^[A-Z0-9]{18}[0-9]{2}$')
+
+# Maximum number of LEIs requested from the GLEIF API in a single call
+LEI_BATCH_SIZE = 200
+
+# Maximum number of LEI codes bound to a single SQLite cache query, kept below
+# the 999 host parameter limit of older SQLite builds
+SQLITE_BATCH_SIZE = 900
+
+# Number of bytes of input CSV read and enriched at a time
+CSV_BLOCK_SIZE = 32 << 20
+
+# Integer codes for the countries with a transaction cost rule
+COUNTRY_OTHER, COUNTRY_GB, COUNTRY_NL = 0, 1, 2
+COUNTRY_CODES = {'GB': COUNTRY_GB, 'NL': COUNTRY_NL}
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _transaction_costs_kernel(country_code, notional, rate):
+        """Compiled per-row transaction cost rules over flat NumPy arrays."""
+        out = np.zeros(country_code.size)
+        for i in prange(country_code.size):
+            if country_code[i] == COUNTRY_GB:
+                out[i] = notional[i] * rate[i] - notional[i]
+            elif country_code[i] == COUNTRY_NL and rate[i] != 0.0:
+                out[i] = abs(notional[i] / rate[i] - notional[i])
+        return out
+else:
+    _transaction_costs_kernel = None
+
+def _chunked(items: List[Any], size: int):
+    """Yield successive slices of items with at most size elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _event_loop_running() -> bool:
+    """Return True if called from code running inside an asyncio event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter shared by the sync and async fetch paths.
+    
+    Callers reserve a token up front and wait only for as long as the bucket
+    needs to refill, so cache hits never pay for the rate limit.
+    """
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Initialize the token bucket.
+        
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens, i.e. the allowed burst size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+    
+    def acquire(self):
+        """Block until a token is available."""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a token is available."""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class LEICache:
+    """
+    SQLite-backed LEI cache with a dict-like interface.
+    
+    Entries are looked up per key and written as they are added, so the cache
+    never has to be loaded or saved as a whole, survives crashes and can be
+    shared between processes.
+    """
+    
+    def __init__(self, cache_file: str):
+        """
+        Open (or create) the cache database.
+        
+        Args:
+            cache_file: Path of the SQLite database file
+        """
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lei ("
+            "code TEXT PRIMARY KEY, legal_name TEXT, bic TEXT, country TEXT)"
+        )
+        self._conn.commit()
+    
+    def __getitem__(self, lei_code: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT legal_name, bic, country FROM lei WHERE code = ?", (lei_code,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(lei_code)
+        return {'legalName': row[0], 'bic': row[1], 'country': row[2]}
+    
+    def __setitem__(self, lei_code: str, record: Dict[str, Any]):
+        self.update({lei_code: record})
+    
+    def __contains__(self, lei_code: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM lei WHERE code = ?", (lei_code,)).fetchone()
+        return row is not None
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM lei").fetchone()[0]
+    
+    def get(self, lei_code: str, default: Any = None) -> Any:
+        try:
+            return self[lei_code]
+        except KeyError:
+            return default
+    
+    def get_many(self, lei_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up many LEI codes with one query per SQLITE_BATCH_SIZE codes.
+        
+        Args:
+            lei_codes: LEI codes to look up
+            
+        Returns:
+            Dictionary mapping each cached LEI code to its record; codes not in
+            the cache are left out
+        """
+        records = {}
+        with self._lock:
+            for chunk in _chunked(lei_codes, SQLITE_BATCH_SIZE):
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT code, legal_name, bic, country FROM lei WHERE code IN ({placeholders})", chunk
+                )
+                for code, legal_name, bic, country in rows:
+                    records[code] = {'legalName': legal_name, 'bic': bic, 'country': country}
+        return records
+    
+    def items(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT code, legal_name, bic, country FROM lei").fetchall()
+        return [(code, {'legalName': legal_name, 'bic': bic, 'country': country})
+                for code, legal_name, bic, country in rows]
+    
+    def update(self, records: Dict[str, Dict[str, Any]]):
+        """Insert or replace the given records in a single transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO lei (code, legal_name, bic, country) VALUES (?, ?, ?, ?)",
+                [(lei_code, record['legalName'], record['bic'], record['country'])
+                 for lei_code, record in records.items()]
+            )
+    
+    def checkpoint(self):
+        """Fold the write-ahead log back into the main database file."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
 
 class LEIEnrichmentError(Exception):
     """Custom exception for LEI enrichment errors"""
@@ -22,218 +248,444 @@ class LEIDataEnricher:
                  base_url: str = "https://api.gleif.org/api/v1/lei-records",
                  rate_limit_delay: float = 0.1,
                  max_retries: int = 3,
-                 timeout: int = 30):
+                 timeout: int = 30,
+                 max_concurrency: int = 20):
         """
         Initialize the LEI enricher.
         
         Args:
             base_url: GLEIF API base URL
-            rate_limit_delay: Delay between API calls (seconds)
+            rate_limit_delay: Minimum average delay between API calls (seconds)
             max_retries: Maximum number of retry attempts
             timeout: Request timeout in seconds
+            max_concurrency: Maximum number of concurrent API requests
         """
         self.base_url = base_url
         self.rate_limit_delay = rate_limit_delay
+        self._rate_limiter = TokenBucket(1.0 / rate_limit_delay) if rate_limit_delay > 0 else None
         self.max_retries = max_retries
         self.timeout = timeout
+        self.max_concurrency = max_concurrency
         self._lei_cache = {}
+        self._cache_lock = threading.Lock()
         
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
+        # Reuse pooled keep-alive connections and let urllib3 handle retries
+        self._session = requests.Session()
+        self._retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True
         )
-        self.logger = logging.getLogger(__name__)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=self._retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
+        self.logger = logger
+    
+    def __enter__(self):
+        return self
     
-    def _fetch_lei_data(self, lei_code: str) -> Dict[str, Any]:
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """Close the underlying HTTP session and the persistent LEI cache, if any."""
+        self._session.close()
+        if isinstance(self._lei_cache, LEICache):
+            self._lei_cache.close()
+    
+    def _batch_params(self, leis: List[str]) -> Dict[str, Any]:
+        """Build the GLEIF API query parameters filtering on a comma-separated list of LEIs."""
+        return {'filter[lei]': ','.join(leis), 'page[size]': LEI_BATCH_SIZE}
+    
+    def _fetch_lei_batch(self, leis: List[str]) -> Dict[str, Dict[str, Any]]:
         """
-        Fetch LEI data from GLEIF API with retry logic.
+        Fetch LEI data for up to LEI_BATCH_SIZE LEIs from GLEIF API in one request,
+        retrying transient failures via the session.
         
         Args:
-            lei_code: Legal Entity Identifier
+            leis: Legal Entity Identifiers to fetch
             
         Returns:
-            Dictionary containing LEI data
+            Dictionary mapping each LEI code to its LEI data
             
         Raises:
             LEIEnrichmentError: If API call fails after all retries
         """
-        # Check cache first
-        if lei_code in self._lei_cache:
-            self.logger.debug(f"Using cached data for LEI: {lei_code}")
-            return self._lei_cache[lei_code]
+        try:
+            self.logger.debug("Fetching LEI data for %d LEIs", len(leis))
+            
+            # Rate limiting
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            
+            response = self._session.get(self.base_url, params=self._batch_params(leis), timeout=self.timeout)
+            response.raise_for_status()
+            
+        except requests.exceptions.RequestException as e:
+            raise LEIEnrichmentError(f"Failed to fetch data for {len(leis)} LEIs: {e}")
+        
+        return self._store_batch(response.content, leis)
+    
+    def _store_batch(self, body: bytes, leis: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Parse a batch response body and add the records to the LEI cache.
+        
+        Args:
+            body: Raw JSON body of the GLEIF response
+            leis: Legal Entity Identifiers requested in the batch
+            
+        Returns:
+            Dictionary mapping each LEI code to its LEI data, with empty values
+            for every LEI if the body could not be parsed
+        """
+        try:
+            results = self._parse_lei_response(_json_loads(body), leis)
+        except (KeyError, TypeError, ValueError) as e:
+            # ValueError covers malformed JSON from both json and orjson. Don't cache
+            # the empty values, so the LEIs are fetched again next time
+            self.logger.error("Error parsing response for %d LEIs: %s", len(leis), e)
+            return {lei_code: {'legalName': '', 'bic': '', 'country': ''} for lei_code in leis}
         
-        url = f"{self.base_url}?filter[lei]={lei_code}"
+        # Cache the results; the lock serialises updates from the thread pool
+        # fallback and is uncontended when batches run on the event loop
+        with self._cache_lock:
+            self._lei_cache.update(results)
+        return results
+    
+    def _retry_delay(self, retry_number: int, retry_after: Optional[str]) -> float:
+        """
+        Seconds to wait before a retry, following the session's urllib3 Retry policy.
         
-        for attempt in range(self.max_retries):
+        Args:
+            retry_number: 1 for the first retry, 2 for the second, and so on
+            retry_after: Value of the response's Retry-After header, if any
+            
+        Returns:
+            The server's Retry-After delay when given, exponential backoff otherwise
+        """
+        if retry_after is not None and self._retry.respect_retry_after_header:
             try:
-                self.logger.debug(f"Fetching LEI data for: {lei_code} (attempt {attempt + 1})")
-                
-                response = requests.get(url, timeout=self.timeout)
-                response.raise_for_status()
-                
-                data = response.json()
+                return self._retry.parse_retry_after(retry_after)
+            except InvalidHeader:
+                pass
+        if retry_number <= 1:
+            return 0.0
+        return min(Retry.DEFAULT_BACKOFF_MAX, self._retry.backoff_factor * 2 ** (retry_number - 1))
+    
+    async def _fetch_lei_batch_async(self,
+                                     session: 'aiohttp.ClientSession',
+                                     sem: asyncio.Semaphore,
+                                     leis: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch LEI data for up to LEI_BATCH_SIZE LEIs from GLEIF API asynchronously
+        in one request, retrying transient failures like the requests session.
+        
+        Args:
+            session: Shared aiohttp client session
+            sem: Semaphore bounding the number of in-flight requests
+            leis: Legal Entity Identifiers to fetch
+            
+        Returns:
+            Dictionary mapping each LEI code to its LEI data
+            
+        Raises:
+            LEIEnrichmentError: If API call fails after all retries
+        """
+        params = self._batch_params(leis)
+        
+        # Retry with the same policy as the requests session: only on connection
+        # errors, timeouts and retryable statuses, honouring Retry-After
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                self.logger.debug("Fetching LEI data for %d LEIs (attempt %d)", len(leis), attempt + 1)
                 
-                # Extract relevant data
-                if 'data' in data and len(data['data']) > 0:
-                    lei_record = data['data'][0]
-                    attributes = lei_record.get('attributes', {})
-                    
-                    # Extract legal name from entity.legalName.name
-                    legal_name = ''
-                    entity = attributes.get('entity', {})
-                    if entity and 'legalName' in entity:
-                        legal_name = entity['legalName'].get('name', '')
-                    
-                    # Extract BIC from attributes.bic array (take first one if available)
-                    bic = ''
-                    bic_list = attributes.get('bic', [])
-                    if isinstance(bic_list, list) and len(bic_list) > 0:
-                        bic = bic_list[0]
-                    elif isinstance(bic_list, str):  # In case it's returned as string
-                        bic = bic_list
-                    
-                    # Extract country from entity.legalAddress.country
-                    country = ''
-                    if entity and 'legalAddress' in entity:
-                        country = entity['legalAddress'].get('country', '')
-                    
-                    result = {
-                        'legalName': legal_name,
-                        'bic': bic,
-                        'country': country
-                    }
-                    
-                    # Cache the result
-                    self._lei_cache[lei_code] = result
-                    
+                async with sem:
                     # Rate limiting
-                    time.sleep(self.rate_limit_delay)
-                    
-                    return result
-                else:
-                    # No data found for this LEI
-                    result = {'legalName': '', 'bic': '', 'country': ''}
-                    self._lei_cache[lei_code] = result
-                    return result
+                    if self._rate_limiter is not None:
+                        await self._rate_limiter.acquire_async()
                     
-            except requests.exceptions.RequestException as e:
-                self.logger.warning(f"Request failed for LEI {lei_code} (attempt {attempt + 1}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                    async with session.get(self.base_url, params=params) as response:
+                        if not self._retry.is_retry('GET', response.status, 'Retry-After' in response.headers):
+                            response.raise_for_status()
+                            body = await response.read()
+                            break
+                        error = f"HTTP {response.status} {response.reason}"
+                        retry_after = response.headers.get('Retry-After')
+            
+            except aiohttp.ClientResponseError as e:
+                # Non-retryable status, e.g. a 4xx other than 429
+                raise LEIEnrichmentError(f"Failed to fetch data for {len(leis)} LEIs: {e}")
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            
+            if attempt == self.max_retries:
+                raise LEIEnrichmentError(f"Failed to fetch data for {len(leis)} LEIs after {self.max_retries} retries: {error}")
+            
+            delay = self._retry_delay(attempt + 1, retry_after)
+            self.logger.warning("Request failed for %d LEIs (attempt %d), retrying in %.1fs: %s",
+                                len(leis), attempt + 1, delay, error)
+            await asyncio.sleep(delay)
+        
+        return self._store_batch(body, leis)
+    
+    async def _fetch_batches_async(self, chunks: List[List[str]]) -> List[Any]:
+        """
+        Fetch LEI batches concurrently on a shared aiohttp session.
+        
+        Args:
+            chunks: Batches of Legal Entity Identifiers to fetch
+            
+        Returns:
+            For each batch, its LEI data or the exception raised while fetching it
+        """
+        sem = asyncio.Semaphore(self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            return await asyncio.gather(
+                *[self._fetch_lei_batch_async(session, sem, chunk) for chunk in chunks],
+                return_exceptions=True
+            )
+    
+    def _fetch_all(self, lei_codes) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch LEI data for all given codes, batching the uncached ones into
+        concurrent bulk requests.
+        
+        Batches are fetched with asyncio and aiohttp when aiohttp is installed,
+        and on a thread pool over the pooled requests session otherwise. The
+        thread pool is also used when the caller already runs an event loop
+        (e.g. Jupyter or an async service), where asyncio.run is not allowed.
+        
+        Args:
+            lei_codes: Sequence of Legal Entity Identifiers
+            
+        Returns:
+            Dictionary mapping each LEI code to its LEI data
+        """
+        # Normalise codes and drop invalid ones, so they never reach a batch request
+        # or the cache; each input code maps to the LEI it is looked up as
+        normalized = {}
+        for lei_code in lei_codes:
+            if isinstance(lei_code, str):
+                lei = lei_code.strip().upper()
+                if LEI_PATTERN.match(lei):
+                    normalized[lei_code] = lei
+        valid_leis = list(dict.fromkeys(normalized.values()))
+        
+        records = self._get_cached(valid_leis)
+        missing_leis = [lei for lei in valid_leis if lei not in records]
+        self.logger.info("Fetching %d uncached LEI codes", len(missing_leis))
+        
+        if missing_leis:
+            chunks = list(_chunked(missing_leis, LEI_BATCH_SIZE))
+            
+            if aiohttp is not None and not _event_loop_running():
+                results = asyncio.run(self._fetch_batches_async(chunks))
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                    futures = [executor.submit(self._fetch_lei_batch, chunk) for chunk in chunks]
+                    results = [future.exception() or future.result() for future in futures]
+            
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, LEIEnrichmentError):
+                    self.logger.error("Failed to enrich LEIs %s: %s", ', '.join(chunk), result)
+                elif isinstance(result, BaseException):
+                    raise result
                 else:
-                    raise LEIEnrichmentError(f"Failed to fetch data for LEI {lei_code} after {self.max_retries} attempts: {e}")
+                    records.update(result)
+        
+        # Invalid LEIs and LEIs whose batch failed get empty values
+        empty = {'legalName': '', 'bic': '', 'country': ''}
+        return {lei_code: records.get(normalized.get(lei_code), empty) for lei_code in lei_codes}
+    
+    def _get_cached(self, lei_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the cached records for the given LEI codes, skipping uncached ones."""
+        if isinstance(self._lei_cache, LEICache):
+            return self._lei_cache.get_many(lei_codes)
+        with self._cache_lock:
+            return {lei_code: self._lei_cache[lei_code] for lei_code in lei_codes
+                    if lei_code in self._lei_cache}
+    
+    def _parse_lei_response(self, data: Dict[str, Any], leis: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extract the relevant fields from a GLEIF API response.
+        
+        Args:
+            data: Decoded JSON response from the GLEIF API
+            leis: Legal Entity Identifiers that were requested
             
-            except (KeyError, json.JSONDecodeError) as e:
-                self.logger.error(f"Error parsing response for LEI {lei_code}: {e}")
-                result = {'legalName': '', 'bic': '', 'country': ''}
-                self._lei_cache[lei_code] = result
-                return result
+        Returns:
+            Dictionary mapping each requested LEI code to its legalName, bic and country
+        """
+        # LEIs without a record in the response get empty values
+        results = {lei_code: {'legalName': '', 'bic': '', 'country': ''} for lei_code in leis}
+        
+        for lei_record in data['data']:
+            attributes = lei_record['attributes']
+            
+            # Extract BIC from attributes.bic array (take first one if available)
+            bic_list = attributes.get('bic') or ()
+            bic = bic_list[0] if bic_list else ''
+            
+            # Extract legal name from entity.legalName.name and country from
+            # entity.legalAddress.country; missing fields are the rare, cold path
+            try:
+                legal_name = attributes['entity']['legalName']['name'] or ''
+            except (KeyError, TypeError):
+                legal_name = ''
+            try:
+                country = attributes['entity']['legalAddress']['country'] or ''
+            except (KeyError, TypeError):
+                country = ''
+            
+            results[attributes['lei']] = {
+                'legalName': legal_name,
+                'bic': bic,
+                'country': country
+            }
+        
+        return results
     
     def enrich_dataset(self, input_data: pd.DataFrame) -> pd.DataFrame:
         """
         Enrich the input dataset with LEI information.
         
         Args:
-            input_data: DataFrame containing transaction data with 'lei' column
+            input_data: DataFrame containing transaction data with 'lei', 'notional'
+                and 'rate' columns
             
         Returns:
-            Enriched DataFrame with additional 'legalName' and 'bic' columns
+            Enriched DataFrame with additional 'legalName', 'bic' and
+            'transaction_costs' columns
             
         Raises:
-            LEIEnrichmentError: If required columns are missing
+            LEIEnrichmentError: If the 'lei', 'notional' or 'rate' column is missing
         """
         if 'lei' not in input_data.columns:
             raise LEIEnrichmentError("Input data must contain 'lei' column")
         
-        self.logger.info(f"Starting enrichment for {len(input_data)} records")
+        # notional and rate feed the transaction cost calculation
+        missing = [col for col in ('notional', 'rate') if col not in input_data.columns]
+        if missing:
+            raise LEIEnrichmentError(f"Input data must contain {', '.join(repr(col) for col in missing)} column(s)")
         
-        # Create a copy to avoid modifying the original
-        enriched_data = input_data.copy()
+        self.logger.info("Starting enrichment for %d records", len(input_data))
         
-        # Get unique LEI codes to minimize API calls
-        unique_leis = input_data['lei'].unique()
-        self.logger.info(f"Found {len(unique_leis)} unique LEI codes")
+        # Get unique LEI codes to minimize API calls, along with each row's index into them
+        codes, unique_leis = pd.factorize(input_data['lei'].to_numpy())
+        self.logger.info("Found %d unique LEI codes", len(unique_leis))
         
-        # Fetch data for each unique LEI
-        lei_info = {}
-        for i, lei_code in enumerate(unique_leis, 1):
-            self.logger.info(f"Processing LEI {i}/{len(unique_leis)}: {lei_code}")
-            try:
-                lei_info[lei_code] = self._fetch_lei_data(lei_code)
-            except LEIEnrichmentError as e:
-                self.logger.error(f"Failed to enrich LEI {lei_code}: {e}")
-                lei_info[lei_code] = {'legalName': '', 'bic': '', 'country': ''}
+        # Fetch data for all unique LEIs in concurrent bulk requests
+        lei_info = self._fetch_all(unique_leis)
         
-        # Add enriched data to DataFrame
-        enriched_data['legalName'] = enriched_data['lei'].map(lambda x: lei_info.get(x, {}).get('legalName', ''))
-        enriched_data['bic'] = enriched_data['lei'].map(lambda x: lei_info.get(x, {}).get('bic', ''))
-        enriched_data['country'] = enriched_data['lei'].map(lambda x: lei_info.get(x, {}).get('country', ''))
+        # Build lookup tables indexed by LEI code; the extra trailing slot holds the
+        # empty values picked up by rows with a missing LEI (code -1). Countries are
+        # mapped to integer codes here, once per unique LEI rather than once per row
+        records = [lei_info[lei_code] for lei_code in unique_leis]
+        records.append({'legalName': '', 'bic': '', 'country': ''})
+        names_by_idx = np.array([record['legalName'] for record in records], dtype=object)
+        bics_by_idx = np.array([record['bic'] for record in records], dtype=object)
+        country_codes_by_idx = np.array(
+            [COUNTRY_CODES.get((record['country'] or '').upper(), COUNTRY_OTHER) for record in records],
+            dtype=np.int8
+        )
         
-        # Calculate transaction_costs based on country and business logic
+        # Calculate transaction_costs based on country and business logic; country is
+        # only consumed here and never added to the output
         self.logger.info("Calculating transaction costs based on country-specific logic")
-        enriched_data['transaction_costs'] = enriched_data.apply(self._calculate_transaction_costs, axis=1)
+        transaction_costs = self._calculate_transaction_costs(
+            country_codes_by_idx[codes],
+            input_data['notional'],
+            input_data['rate']
+        )
+        enrich_cols = pd.DataFrame({
+            'legalName': names_by_idx[codes],
+            'bic': bics_by_idx[codes],
+            'transaction_costs': transaction_costs
+        }, index=input_data.index)
         
-        # Remove the temporary country column as it's not needed in final output
-        enriched_data = enriched_data.drop('country', axis=1)
+        # Append the new columns without copying the original ones, leaving input_data untouched;
+        # any enrichment columns already present (e.g. re-enriching an output file) are replaced
+        enriched_data = pd.concat(
+            [input_data.drop(columns=enrich_cols.columns, errors='ignore'), enrich_cols],
+            axis=1, copy=False
+        )
         
         self.logger.info("Enrichment completed successfully")
         return enriched_data
     
-    def _calculate_transaction_costs(self, row) -> float:
+    def _calculate_transaction_costs(self,
+                                    country_code: np.ndarray,
+                                    notional: pd.Series,
+                                    rate: pd.Series) -> np.ndarray:
         """
         Calculate transaction costs based on country-specific business logic.
         
+        The rules are evaluated over whole NumPy arrays, using a compiled numba
+        kernel when numba is installed and vectorized np.where otherwise:
+        - GB: transaction_costs = notional * rate - notional
+        - NL: transaction_costs = Abs(notional * (1/rate) - notional), 0 when rate is 0
+        - Other countries or unknown: 0
+        
         Args:
-            row: DataFrame row containing transaction data
+            country_code: COUNTRY_* code of each transaction's legal entity
+            notional: Transaction notional amounts
+            rate: Transaction rates
             
         Returns:
-            Calculated transaction cost
+            Array of calculated transaction costs, aligned with the inputs
         """
-        try:
-            country = row.get('country', '').upper()
-            notional = float(row.get('notional', 0))
-            rate = float(row.get('rate', 0))
-            
-            if country == 'GB':
-                # For GB: transaction_costs = notional * rate - notional
-                transaction_costs = notional * rate - notional
-            elif country == 'NL':
-                # For NL: transaction_costs = Abs(notional * (1/rate) - notional)
-                if rate != 0:  # Avoid division by zero
-                    transaction_costs = abs(notional * (1/rate) - notional)
-                else:
-                    self.logger.warning(f"Zero rate encountered for NL calculation, setting cost to 0")
-                    transaction_costs = 0.0
-            else:
-                # For other countries or unknown, set to 0
-                self.logger.info(f"No specific calculation rule for country '{country}', setting cost to 0")
-                transaction_costs = 0.0
-            
-            return transaction_costs
-            
-        except (ValueError, TypeError) as e:
-            self.logger.error(f"Error calculating transaction costs: {e}")
-            return 0.0
+        notional = pd.to_numeric(notional, errors='coerce').fillna(0).to_numpy(dtype=float)
+        rate = pd.to_numeric(rate, errors='coerce').fillna(0).to_numpy(dtype=float)
+        
+        if _transaction_costs_kernel is not None:
+            return _transaction_costs_kernel(country_code, notional, rate)
+        
+        gb_costs = notional * rate - notional
+        
+        # Avoid division by zero
+        safe_rate = np.where(rate == 0, 1.0, rate)
+        nl_costs = np.where(rate == 0, 0.0, np.abs(notional / safe_rate - notional))
+        
+        return np.where(country_code == COUNTRY_GB, gb_costs,
+                        np.where(country_code == COUNTRY_NL, nl_costs, 0.0))
     
-    def save_cache(self, cache_file: str = "lei_cache.json"):
-        """Save the LEI cache to a file for future use."""
+    def save_cache(self, cache_file: str = "lei_cache.db"):
+        """
+        Persist the LEI cache to an SQLite file for future use.
+        
+        A cache opened with load_cache is already written on every fetch, so
+        this only checkpoints its write-ahead log; an in-memory cache is copied
+        into cache_file and the enricher switches over to it.
+        """
         try:
-            with open(cache_file, 'w') as f:
-                json.dump(self._lei_cache, f, indent=2)
-            self.logger.info(f"Cache saved to {cache_file}")
+            if not isinstance(self._lei_cache, LEICache):
+                cache = LEICache(cache_file)
+                cache.update(self._lei_cache)
+                self._lei_cache = cache
+            self._lei_cache.checkpoint()
+            self.logger.info("Cache saved to %s", self._lei_cache.cache_file)
         except Exception as e:
-            self.logger.error(f"Failed to save cache: {e}")
+            self.logger.error("Failed to save cache: %s", e)
     
-    def load_cache(self, cache_file: str = "lei_cache.json"):
-        """Load LEI cache from a file."""
+    def load_cache(self, cache_file: str = "lei_cache.db"):
+        """Open the SQLite-backed LEI cache; entries are read on demand."""
         try:
-            if Path(cache_file).exists():
-                with open(cache_file, 'r') as f:
-                    self._lei_cache = json.load(f)
-                self.logger.info(f"Cache loaded from {cache_file}")
+            cache = LEICache(cache_file)
+            # Keep anything fetched before the cache was opened
+            cache.update(dict(self._lei_cache.items()))
+            if isinstance(self._lei_cache, LEICache):
+                self._lei_cache.close()
+            self._lei_cache = cache
+            self.logger.info("Cache loaded from %s", cache_file)
         except Exception as e:
-            self.logger.error(f"Failed to load cache: {e}")
+            self.logger.error("Failed to load cache: %s", e)
 
 
 def main():
@@ -243,48 +695,87 @@ def main():
 
     try:
         # Initialize the enricher
-        enricher = LEIDataEnricher()
-        
-        # Load existing cache if available
-        enricher.load_cache()
-        
-        # Load CSV
-        df = pd.read_csv("sample_input.csv")
-        
-        print("Original data shape:", df.shape)
-        print("\nFirst few rows of original data:")
-        print(df.head())
-        
-        # Enrich the data
-        enriched_df = enricher.enrich_dataset(df)
-        
-        print("\nEnriched data shape:", enriched_df.shape)
-        print("\nFirst few rows of enriched data:")
-        print(enriched_df.head())
-        
-        # Save the enriched data
-        output_file = 'output.csv'
-        enriched_df.to_csv(output_file, index=False)
-        print(f"\nEnriched data saved to: {output_file}")
-        
-        # Save cache for future runs
-        enricher.save_cache()
-        
-        # Display summary
-        print(f"\nEnrichment Summary:")
-        print(f"- Total records processed: {len(enriched_df)}")
-        print(f"- Unique LEIs processed: {len(df['lei'].unique())}")
-        print(f"- Records with legal names: {len(enriched_df[enriched_df['legalName'] != ''])}")
-        print(f"- Records with BIC codes: {len(enriched_df[enriched_df['bic'] != ''])}")
-        print(f"- Records with transaction costs calculated: {len(enriched_df[enriched_df['transaction_costs'] != 0])}")
-        
-        # Show sample of calculated transaction costs
-        print(f"\nSample Transaction Costs:")
-        cost_sample = enriched_df[['lei', 'notional', 'rate', 'transaction_costs']].head()
-        print(cost_sample.to_string(index=False))
+        with LEIDataEnricher() as enricher:
+            # Load existing cache if available
+            enricher.load_cache()
+            
+            # Stream the CSV with the pyarrow reader in blocks of Arrow-backed columns,
+            # so memory is bounded by the block size rather than the file size.
+            # Column types are otherwise inferred from the first block only, and a
+            # later block that disagrees fails the read. Every column is pinned from
+            # the header: the numeric inputs to the cost calculation as floats and
+            # everything else as text, so it is written back out unchanged
+            input_file = "sample_input.csv"
+            with open(input_file, newline='', encoding='utf-8-sig') as f:
+                header = next(csv.reader(f), [])
+            column_types = {name: pa.string() for name in header}
+            column_types.update({'notional': pa.float64(), 'rate': pa.float64()})
+            convert_options = pv.ConvertOptions(column_types=column_types)
+            read_options = pv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+            reader = pv.open_csv(input_file, read_options=read_options, convert_options=convert_options)
+            
+            output_file = 'output.csv'
+            total_records = 0
+            records_with_names = 0
+            records_with_bics = 0
+            records_with_costs = 0
+            unique_leis = set()
+            
+            # Write to a temporary file first so a failed run never leaves a
+            # truncated output.csv behind
+            partial_file = output_file + '.partial'
+            try:
+                with open(partial_file, 'w', newline='') as output:
+                    for chunk_number, batch in enumerate(reader):
+                        df = batch.to_pandas(types_mapper=pd.ArrowDtype)
+                        
+                        # Enrich the chunk; the LEI cache carries over, so LEIs seen in
+                        # earlier chunks are not fetched again
+                        enriched_df = enricher.enrich_dataset(df)
+                        
+                        # Append the enriched chunk to the output, writing the header once
+                        enriched_df.to_csv(output, header=chunk_number == 0, index=False, lineterminator="\n")
+                        
+                        if chunk_number == 0:
+                            print("First chunk shape:", df.shape)
+                            print("\nFirst few rows of original data:")
+                            print(df.head())
+                            print("\nFirst few rows of enriched data:")
+                            print(enriched_df.head())
+                            cost_sample = enriched_df[['lei', 'notional', 'rate', 'transaction_costs']].head()
+                        
+                        total_records += len(enriched_df)
+                        records_with_names += int((enriched_df['legalName'] != '').sum())
+                        records_with_bics += int((enriched_df['bic'] != '').sum())
+                        records_with_costs += int((enriched_df['transaction_costs'] != 0).sum())
+                        unique_leis.update(df['lei'].dropna())
+            except BaseException:
+                # Don't leave a half-written partial file behind
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                raise
+            
+            os.replace(partial_file, output_file)
+            print(f"\nEnriched data saved to: {output_file}")
+            
+            # Save cache for future runs
+            enricher.save_cache()
+            
+            # Display summary
+            print(f"\nEnrichment Summary:")
+            print(f"- Total records processed: {total_records}")
+            print(f"- Unique LEIs processed: {len(unique_leis)}")
+            print(f"- Records with legal names: {records_with_names}")
+            print(f"- Records with BIC codes: {records_with_bics}")
+            print(f"- Records with transaction costs calculated: {records_with_costs}")
+            
+            # Show sample of calculated transaction costs
+            if total_records:
+                print(f"\nSample Transaction Costs:")
+                print(cost_sample.to_string(index=False))
 
     except Exception as e:
-        logging.error(f"Error in enrichment process: {e}")
+        logging.error("Error in enrichment process: %s", e)
 
 
 if __name__ == "__main__":